@@ -0,0 +1,81 @@
+# File: compiletest.py
+#    from chapter 7 of _Tree-based Machine Learning Algorithms_
+#
+# Author: Clinton Sheppard <fluentcoder@gmail.com>
+# Copyright (c) 2017 Clinton Sheppard
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.  See the License for the specific language governing
+# permissions and limitations under the License.
+
+import dtree
+import operator
+import random
+
+
+def get_depth(nodesById, nodeId=0):
+    node = nodesById[nodeId]
+    if len(node) == 2:
+        return 0
+    return 1 + max(get_depth(nodesById, node[4]),
+                   get_depth(nodesById, node[5]))
+
+
+def check(name, data, outcomeLabel, continuousAttributes,
+          minimumSubsetSizePercentage=0):
+    tree = dtree.build(data, outcomeLabel, continuousAttributes,
+                       minimumSubsetSizePercentage=minimumSubsetSizePercentage)
+    nodes = tree.get_nodes()
+    splits = [node for node in nodes if len(node) > 2]
+    depth = get_depth({node[0]: node for node in nodes})
+    print("{}: {} nodes, {} eq splits, {} gt splits, "
+          "{} distribution leaves, depth {}".format(
+              name, len(nodes),
+              sum(1 for node in splits if node[3] == operator.eq),
+              sum(1 for node in splits if node[3] == operator.gt),
+              sum(1 for node in nodes if len(node) == 2 and
+                  isinstance(node[1], list)),
+              depth))
+    rows = data[1:] * 3
+    random.seed(1)
+    expected = [tree.get_prediction(row) for row in rows]
+    tree.compile()
+    random.seed(1)
+    actual = [tree.get_prediction(row) for row in rows]
+    if actual != expected:
+        raise Exception('{}: compiled predictions differ from the '
+                        'interpreter'.format(name))
+    print("{}: {} compiled predictions match".format(name, len(rows)))
+    return depth
+
+
+random.seed(2)
+colors = ['red', 'green', 'blue', 'yellow']
+shapes = ['round', 'square', 'oval']
+mixed = [['Color', 'Shape', 'Size', 'Weight', 'Outcome']]
+for _ in range(400):
+    color = random.choice(colors)
+    shape = random.choice(shapes)
+    size = random.randint(1, 20)
+    weight = round(random.uniform(0, 10), 2)
+    outcome = 'yes' if (color == 'red' or size > 12) != \
+                       (random.random() < .15) else 'no'
+    mixed.append([color, shape, size, weight, outcome])
+check('mixed', mixed, 'Outcome', ['Size', 'Weight'], 3)
+
+continuous = [['Color', 'Size', 'Weight']]
+for row in mixed[1:]:
+    continuous.append([row[0], row[2], row[3]])
+check('continuous outcome', continuous, 'Weight', ['Size', 'Weight'], 5)
+
+deep = [['Id', 'Outcome']] + [
+    [i, random.choice(['odd', 'even'])] for i in range(1, 121)]
+if check('deep', deep, 'Outcome', []) <= dtree._MAX_COMPILED_DEPTH:
+    raise Exception('deep tree does not exceed the compiled depth limit')
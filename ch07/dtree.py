@@ -15,49 +15,81 @@
 # implied.  See the License for the specific language governing
 # permissions and limitations under the License.
 
-from collections import Counter
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate, compress, islice, repeat
+from multiprocessing import shared_memory
 from numbers import Number
 import operator
 import math
 import csv
+import hashlib
+import json
+import mmap
+import os
 import random
+import re
+import struct
+import sys
+import weakref
 
 
 def _get_bias(avPair, dataRowIndexes, data, outcomeIndex, minimumSubsetSize,
               validationRowIndexes):
+    data = as_dataset(data)
     attrIndex, attrValue, isMatch = avPair
+    column = data.column(attrIndex)
     if len(validationRowIndexes) > 0:
-        validationMatchIndexes = {i for i in validationRowIndexes if
-                                  isMatch(data[i][attrIndex], attrValue)}
-        validationNonMatchIndexes = validationRowIndexes - \
-                                    validationMatchIndexes
+        validationMatchIndexes, validationNonMatchIndexes = as_rows(
+            validationRowIndexes).partition(column, isMatch, attrValue)
         if len(validationMatchIndexes) == 0 or len(
                 validationNonMatchIndexes) == 0:
             return -2
-    matchIndexes = {i for i in dataRowIndexes if
-                    isMatch(data[i][attrIndex], attrValue)}
-    nonMatchIndexes = dataRowIndexes - matchIndexes
+    matchIndexes, nonMatchIndexes = as_rows(dataRowIndexes).partition(
+        column, isMatch, attrValue)
     if len(matchIndexes) < minimumSubsetSize or len(
             nonMatchIndexes) < minimumSubsetSize:
         return -1
-    matchOutcomes = {data[i][outcomeIndex] for i in matchIndexes}
-    nonMatchOutcomes = {data[i][outcomeIndex] for i in nonMatchIndexes}
-    numPureRows = (len(matchIndexes) if len(matchOutcomes) == 1 else 0) \
-                  + (len(nonMatchIndexes) if len(nonMatchOutcomes) == 1
-                     else 0)
-    percentPure = numPureRows / len(dataRowIndexes)
-
-    numNonPureRows = len(dataRowIndexes) - numPureRows
+    outcomes = data.column(outcomeIndex)
+    matchOutcomes = {outcomes[i] for i in matchIndexes}
+    nonMatchOutcomes = {outcomes[i] for i in nonMatchIndexes}
+    return _get_bias_from_counts(len(matchIndexes), len(nonMatchIndexes),
+                                 len(matchOutcomes) == 1,
+                                 len(nonMatchOutcomes) == 1)
+
+
+def _get_bias_from_counts(matchCount, nonMatchCount, matchIsPure,
+                          nonMatchIsPure):
+    rowCount = matchCount + nonMatchCount
+    numPureRows = (matchCount if matchIsPure else 0) \
+                  + (nonMatchCount if nonMatchIsPure else 0)
+    percentPure = numPureRows / rowCount
+
+    numNonPureRows = rowCount - numPureRows
     percentNonPure = 1 - percentPure
-    split = 1 - abs(len(matchIndexes) - len(nonMatchIndexes)) / len(
-        dataRowIndexes) - .001
+    split = 1 - abs(matchCount - nonMatchCount) / rowCount - .001
     splitBias = split * percentNonPure if numNonPureRows > 0 else 0
     return splitBias + percentPure
 
 
 def build(data, outcomeLabel, continuousAttributes=None,
           minimumSubsetSizePercentage=0, validationPercentage=0,
-          dataIndexes=None, attrIndexes=None):
+          dataIndexes=None, attrIndexes=None,
+          continuousSplitSearch='center-out', presort=False,
+          maxBins=None, profile=False, rowSelection='array',
+          numJobs=None, parallelism='attributes'):
+    data = as_dataset(data)
+    if rowSelection not in _ROW_SELECTIONS:
+        raise Exception('Unknown row selection: {}'.format(rowSelection))
+    if continuousSplitSearch not in ('center-out', 'exhaustive'):
+        raise Exception('Unknown continuous split search: {}'.format(
+            continuousSplitSearch))
+    if parallelism not in ('attributes', 'nodes'):
+        raise Exception('Unknown parallelism: {}'.format(parallelism))
+    if maxBins is not None and not 2 <= maxBins <= 255:
+        raise Exception('maxBins must be between 2 and 255.')
     if validationPercentage > 0:
         validationPercentage /= 100
     validationCount = int(validationPercentage *
@@ -69,23 +101,19 @@ def build(data, outcomeLabel, continuousAttributes=None,
                             (len(data) if dataIndexes is None else len(
                                 dataIndexes)))
     if attrIndexes is None:
-        attrIndexes = [index for index, label in enumerate(data[0]) if
+        attrIndexes = [index for index, label in enumerate(data.header) if
                        label != outcomeLabel]
-    outcomeIndex = data[0].index(outcomeLabel)
+    outcomeIndex = data.header.index(outcomeLabel)
     continuousAttrIndexes = set()
     if continuousAttributes is not None:
-        continuousAttrIndexes = {data[0].index(label) for label in
+        continuousAttrIndexes = {data.header.index(label) for label in
                                  continuousAttributes}
         if len(continuousAttrIndexes) != len(continuousAttributes):
             raise Exception(
                 'One or more continuous column names are duplicates.')
     else:
         for attrIndex in attrIndexes:
-            uniqueValues = {row[attrIndex] for rowIndex, row in
-                            enumerate(data) if rowIndex > 0}
-            numericValues = {value for value in uniqueValues if
-                             isinstance(value, Number)}
-            if len(uniqueValues) == len(numericValues):
+            if data.is_numeric(attrIndex):
                 continuousAttrIndexes.add(attrIndex)
 
     if outcomeIndex in continuousAttrIndexes:
@@ -94,87 +122,651 @@ def build(data, outcomeLabel, continuousAttributes=None,
     else:
         outcomeIsContinuous = False
 
-    nodes = []
-    lastNodeNumber = 0
+    bins = None
+    if maxBins is not None:
+        bins = {attrIndex: data.get_bins(attrIndex, maxBins) for attrIndex
+                in continuousAttrIndexes}
     if dataIndexes is None:
-        dataIndexes = {i for i in range(1, len(data))}
-    elif not isinstance(dataIndexes, set):
-        dataIndexes = {i for i in dataIndexes}
+        dataIndexes = range(1, len(data))
     validationIndexes = set()
     if validationCount > 0:
+        if not isinstance(dataIndexes, set):
+            dataIndexes = {i for i in dataIndexes}
         validationIndexes = set(
             random.sample([i for i in dataIndexes], validationCount))
         dataIndexes -= validationIndexes
-    workQueue = [(-1, lastNodeNumber, dataIndexes, validationIndexes)]
+    dataIndexes = as_rows(dataIndexes, rowSelection)
+    validationIndexes = type(dataIndexes)(validationIndexes)
+    context = _BuildContext(data, outcomeIndex, attrIndexes,
+                            continuousAttrIndexes, minimumSubsetSize,
+                            continuousSplitSearch, bins,
+                            isinstance(dataIndexes, RowBitmap) and
+                            not outcomeIsContinuous, profile)
+    sortedIndexes = None
+    if presort and bins is None:
+        sortedIndexes = {}
+        for attrIndex in continuousAttrIndexes:
+            column = data.column(attrIndex)
+            sortedIndexes[attrIndex] = (
+                array('i', sorted(dataIndexes, key=column.__getitem__)),
+                array('i', sorted(validationIndexes,
+                                  key=column.__getitem__)))
+    pool = None
+    if numJobs is not None and numJobs > 1:
+        pool = ProcessPoolExecutor(numJobs,
+                                   initializer=_initialize_worker,
+                                   initargs=(context,))
+    try:
+        if pool is not None and parallelism == 'nodes':
+            nodes = _build_nodes_in_parallel(context, dataIndexes,
+                                             validationIndexes,
+                                             sortedIndexes, pool, numJobs)
+        else:
+            nodes = _build_nodes(context, dataIndexes, validationIndexes,
+                                 sortedIndexes, pool=pool, numJobs=numJobs)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    nodes = sorted(nodes, key=lambda n: n[0])
+    tree = DTree(nodes, data.header, outcomeIsContinuous)
+    if profile:
+        tree.profile = context.profile
+    return tree
+
+
+class BuildProfile:
+    def __init__(self):
+        self.scannedRowCount = 0
+        self.derivedRowCount = 0
+        self.nodeStatistics = {}
+
+
+class _BuildContext:
+    def __init__(self, data, outcomeIndex, attrIndexes,
+                 continuousAttrIndexes, minimumSubsetSize,
+                 continuousSplitSearch, bins, useBitsets, keepStatistics):
+        self.data = data
+        self.outcomeIndex = outcomeIndex
+        self.attrIndexes = attrIndexes
+        self.continuousAttrIndexes = continuousAttrIndexes
+        self.minimumSubsetSize = minimumSubsetSize
+        self.continuousSplitSearch = continuousSplitSearch
+        self.bins = bins
+        self.useBitsets = useBitsets
+        self.keepStatistics = keepStatistics
+        self.profile = BuildProfile()
+        self._set_columns()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in ('outcomes', 'tableColumns', 'bitsets'):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._set_columns()
+
+    def _set_columns(self):
+        self.outcomes = self.data.column(self.outcomeIndex)
+        self.tableColumns = _get_table_columns(
+            self.data, self.attrIndexes, self.continuousAttrIndexes,
+            self.bins)
+        self.bitsets = None
+        if self.useBitsets:
+            self.bitsets = {attrIndex: self.data.get_value_bitsets(attrIndex)
+                            for attrIndex in self.tableColumns if
+                            self.bins is None or
+                            attrIndex not in self.bins}, \
+                           self.data.get_value_bitsets(self.outcomeIndex)
+
+    def get_node_statistics(self, dataRowIndexes, validationRowIndexes):
+        self.profile.scannedRowCount += len(dataRowIndexes)
+        return _get_node_statistics(self.tableColumns, self.outcomes,
+                                    dataRowIndexes, validationRowIndexes,
+                                    self.bitsets)
+
+    def get_potentials(self, dataRowIndexes, validationRowIndexes,
+                       sortedIndexes, statistics):
+        return _get_potentials(self.attrIndexes, self.continuousAttrIndexes,
+                               self.data, dataRowIndexes, self.outcomeIndex,
+                               self.minimumSubsetSize, validationRowIndexes,
+                               self.continuousSplitSearch, sortedIndexes,
+                               self.bins, statistics)
+
+
+def _build_nodes(context, dataIndexes, validationIndexes, sortedIndexes,
+                 statistics=None, pool=None, numJobs=None):
+    nodes = []
+    lastNodeNumber = 0
+    workQueue = [(lastNodeNumber, (dataIndexes, validationIndexes,
+                                   sortedIndexes, statistics))]
     while len(workQueue) > 0:
-        parentNodeId, nodeId, dataRowIndexes, validationRowIndexes = \
-            workQueue.pop()
-        uniqueOutcomes = Counter(
-            data[i][outcomeIndex] for i in dataRowIndexes).most_common()
-        if len(uniqueOutcomes) == 1:
-            nodes.append((nodeId, uniqueOutcomes.pop(0)[0]))
+        nodeId, item = workQueue.pop()
+        node, children = _expand_node(context, nodeId, *item, pool=pool,
+                                      numJobs=numJobs)
+        if children is None:
+            nodes.append((nodeId,) + node)
             continue
-        potentials = _get_potentials(attrIndexes, continuousAttrIndexes,
-                                     data, dataRowIndexes, outcomeIndex,
-                                     minimumSubsetSize,
-                                     validationRowIndexes)
-        if len(potentials) == 0 or potentials[0][0] > 0:
-            nodes.append((nodeId, [(n[0], n[1] / len(dataRowIndexes))
-                                   for n in uniqueOutcomes]))
-            continue
-        attrIndex, attrValue, isMatch = potentials[0][1:]
-        matches = {rowIndex for rowIndex in dataRowIndexes if
-                   isMatch(data[rowIndex][attrIndex], attrValue)}
-        nonMatches = dataRowIndexes - matches
-        validationMatches = {
-            rowIndex for rowIndex in validationRowIndexes if
-            isMatch(data[rowIndex][attrIndex], attrValue)}
-        nonValidationMatches = validationRowIndexes - validationMatches
         lastNodeNumber += 1
         matchId = lastNodeNumber
-        workQueue.append((nodeId, matchId, matches, validationMatches))
+        workQueue.append((matchId, children[0]))
         lastNodeNumber += 1
         nonMatchId = lastNodeNumber
-        workQueue.append((nodeId, nonMatchId, nonMatches,
-                          nonValidationMatches))
-        nodes.append((nodeId, attrIndex, attrValue, isMatch, matchId,
-                      nonMatchId, len(matches), len(nonMatches)))
-    nodes = sorted(nodes, key=lambda n: n[0])
-    return DTree(nodes, data[0], outcomeIsContinuous)
+        workQueue.append((nonMatchId, children[1]))
+        nodes.append((nodeId,) + node[:3] + (matchId, nonMatchId) +
+                     node[3:])
+    return nodes
+
+
+def _build_nodes_in_parallel(context, dataIndexes, validationIndexes,
+                             sortedIndexes, pool, numJobs):
+    nodesById = {}
+    lastNodeNumber = 0
+    pending = [(lastNodeNumber, (dataIndexes, validationIndexes,
+                                 sortedIndexes, None))]
+    while len(pending) < 2 * numJobs:
+        pending.sort(key=lambda p: len(p[1][0]))
+        if len(pending) == 0 or \
+                len(pending[-1][1][0]) < _MIN_PARALLEL_NODE_ROWS:
+            break
+        nodeId, item = pending.pop()
+        node, children = _expand_node(context, nodeId, *item)
+        if children is None:
+            nodesById[nodeId] = (nodeId,) + node
+            continue
+        matchId = lastNodeNumber + 1
+        nonMatchId = lastNodeNumber + 2
+        lastNodeNumber += 2
+        pending.append((matchId, children[0]))
+        pending.append((nonMatchId, children[1]))
+        nodesById[nodeId] = (nodeId,) + node[:3] + (matchId, nonMatchId) + \
+            node[3:]
+    futures = []
+    for nodeId, item in pending:
+        if len(item[0]) >= _MIN_PARALLEL_NODE_ROWS:
+            futures.append((nodeId, pool.submit(_build_subtree, item)))
+            continue
+        lastNodeNumber = _graft_subtree(context, nodesById, nodeId,
+                                        _build_subtree(item, context),
+                                        lastNodeNumber)
+    for nodeId, future in futures:
+        lastNodeNumber = _graft_subtree(context, nodesById, nodeId,
+                                        future.result(), lastNodeNumber)
+    return _renumber_nodes(context, nodesById)
+
+
+def _build_subtree(item, context=None):
+    if context is None:
+        context = _workerContext
+    profile = context.profile
+    context.profile = BuildProfile()
+    try:
+        nodes = _build_nodes(context, *item)
+    finally:
+        subtreeProfile, context.profile = context.profile, profile
+    return nodes, subtreeProfile
+
+
+def _graft_subtree(context, nodesById, rootId, subtree, lastNodeNumber):
+    nodes, subtreeProfile = subtree
+    nodeIds = {0: rootId}
+    for node in nodes:
+        if node[0] != 0:
+            lastNodeNumber += 1
+            nodeIds[node[0]] = lastNodeNumber
+    for node in nodes:
+        if DTree._is_leaf(node):
+            nodesById[nodeIds[node[0]]] = (nodeIds[node[0]], node[1])
+        else:
+            nodesById[nodeIds[node[0]]] = (nodeIds[node[0]],) + \
+                node[1:4] + (nodeIds[node[4]], nodeIds[node[5]]) + node[6:]
+    context.profile.scannedRowCount += subtreeProfile.scannedRowCount
+    context.profile.derivedRowCount += subtreeProfile.derivedRowCount
+    context.profile.nodeStatistics.update(
+        (nodeIds[nodeId], outcomeCounts) for nodeId, outcomeCounts in
+        subtreeProfile.nodeStatistics.items())
+    return lastNodeNumber
+
+
+def _renumber_nodes(context, nodesById):
+    nodeIds = {0: 0}
+    lastNodeNumber = 0
+    workQueue = [0]
+    while len(workQueue) > 0:
+        node = nodesById[workQueue.pop()]
+        if DTree._is_leaf(node):
+            continue
+        for childId in node[4:6]:
+            lastNodeNumber += 1
+            nodeIds[childId] = lastNodeNumber
+            workQueue.append(childId)
+    context.profile.nodeStatistics = {
+        nodeIds[nodeId]: outcomeCounts for nodeId, outcomeCounts in
+        context.profile.nodeStatistics.items()}
+    return [(nodeIds[node[0]], node[1]) if DTree._is_leaf(node) else
+            (nodeIds[node[0]],) + node[1:4] +
+            (nodeIds[node[4]], nodeIds[node[5]]) + node[6:]
+            for node in nodesById.values()]
+
+
+def _expand_node(context, nodeId, dataRowIndexes, validationRowIndexes,
+                 sortedIndexes, statistics, pool=None, numJobs=None):
+    data = context.data
+    outcomeIndex = context.outcomeIndex
+    bins = context.bins
+    bitsets = context.bitsets
+    searchInParallel = pool is not None and \
+        len(dataRowIndexes) >= _MIN_PARALLEL_SEARCH_ROWS
+    if statistics is None and not searchInParallel:
+        statistics = context.get_node_statistics(dataRowIndexes,
+                                                 validationRowIndexes)
+    outcomeCounts = statistics[0] if statistics is not None else \
+        Counter(context.outcomes[i] for i in dataRowIndexes)
+    if context.keepStatistics:
+        context.profile.nodeStatistics[nodeId] = {
+            data.decode(outcomeIndex, outcome): count
+            for outcome, count in outcomeCounts.items()}
+    if len(outcomeCounts) == 1:
+        return (data.decode(outcomeIndex, next(iter(outcomeCounts))),), None
+    if searchInParallel:
+        potentials = _get_potentials_in_parallel(
+            pool, numJobs, context, dataRowIndexes, validationRowIndexes,
+            sortedIndexes)
+    else:
+        potentials = context.get_potentials(
+            dataRowIndexes, validationRowIndexes, sortedIndexes, statistics)
+    if len(potentials) == 0 or potentials[0][0] > 0:
+        uniqueOutcomes = Counter(
+            context.outcomes[i] for i in dataRowIndexes).most_common()
+        return ([(data.decode(outcomeIndex, n[0]),
+                  n[1] / len(dataRowIndexes)) for n in uniqueOutcomes],), \
+            None
+    attrIndex, attrValue, isMatch = potentials[0][1:]
+    if bins is not None and attrIndex in bins:
+        edges, column = bins[attrIndex]
+    else:
+        edges, column = None, data.column(attrIndex)
+    if bitsets is not None and attrIndex in bitsets[0] and \
+            isMatch is operator.eq:
+        valueBits = bitsets[0][attrIndex][attrValue]
+        matches, nonMatches = dataRowIndexes.split(valueBits)
+        validationMatches, nonValidationMatches = \
+            validationRowIndexes.split(valueBits)
+    else:
+        matches, nonMatches = dataRowIndexes.partition(
+            column, isMatch, attrValue)
+        validationMatches, nonValidationMatches = \
+            validationRowIndexes.partition(column, isMatch, attrValue)
+    matchSortedIndexes = None
+    nonMatchSortedIndexes = None
+    if sortedIndexes is not None:
+        matchSortedIndexes = {}
+        nonMatchSortedIndexes = {}
+        for sortedAttrIndex, (sortedRowIndexes,
+                              sortedValidationRowIndexes) in \
+                sortedIndexes.items():
+            sortedMatches, sortedNonMatches = _partition_indexes(
+                sortedRowIndexes, column, isMatch, attrValue)
+            sortedValidationMatches, sortedValidationNonMatches = \
+                _partition_indexes(sortedValidationRowIndexes, column,
+                                   isMatch, attrValue)
+            matchSortedIndexes[sortedAttrIndex] = (
+                sortedMatches, sortedValidationMatches)
+            nonMatchSortedIndexes[sortedAttrIndex] = (
+                sortedNonMatches, sortedValidationNonMatches)
+    matchStatistics = None
+    nonMatchStatistics = None
+    if statistics is not None and len(matches) <= len(nonMatches):
+        matchStatistics = context.get_node_statistics(
+            matches, validationMatches)
+        nonMatchStatistics = _subtract_node_statistics(
+            statistics, matchStatistics)
+        context.profile.derivedRowCount += len(nonMatches)
+    elif statistics is not None:
+        nonMatchStatistics = context.get_node_statistics(
+            nonMatches, nonValidationMatches)
+        matchStatistics = _subtract_node_statistics(
+            statistics, nonMatchStatistics)
+        context.profile.derivedRowCount += len(matches)
+    if edges is not None:
+        attrValue = edges[attrValue]
+    return (attrIndex, data.decode(attrIndex, attrValue), isMatch,
+            len(matches), len(nonMatches)), \
+        ((matches, validationMatches, matchSortedIndexes, matchStatistics),
+         (nonMatches, nonValidationMatches, nonMatchSortedIndexes,
+          nonMatchStatistics))
+
+
+_MIN_PARALLEL_SEARCH_ROWS = 5000
+
+_MIN_PARALLEL_NODE_ROWS = 5000
+
+_workerContext = None
+
+
+def _initialize_worker(context):
+    global _workerContext
+    _workerContext = context
+
+
+def _get_potentials_in_parallel(pool, numJobs, context, dataRowIndexes,
+                                validationRowIndexes, sortedIndexes):
+    attrIndexes = list(dict.fromkeys(
+        [attrIndex for attrIndex in context.attrIndexes if
+         attrIndex not in context.continuousAttrIndexes] +
+        sorted(context.continuousAttrIndexes)))
+    futures = []
+    for job in range(numJobs):
+        jobAttrIndexes = attrIndexes[job::numJobs]
+        if len(jobAttrIndexes) == 0:
+            continue
+        jobSortedIndexes = None if sortedIndexes is None else {
+            attrIndex: sortedIndexes[attrIndex] for attrIndex in
+            jobAttrIndexes if attrIndex in sortedIndexes}
+        futures.append(pool.submit(_get_best_potentials, jobAttrIndexes,
+                                   dataRowIndexes, validationRowIndexes,
+                                   jobSortedIndexes))
+    return sorted(potential for future in futures
+                  for potential in future.result())
+
+
+def _get_best_potentials(attrIndexes, dataRowIndexes, validationRowIndexes,
+                         sortedIndexes):
+    context = _workerContext
+    continuousAttrIndexes = {attrIndex for attrIndex in attrIndexes if
+                             attrIndex in context.continuousAttrIndexes}
+    statistics = _get_node_statistics(
+        {attrIndex: column for attrIndex, column in
+         context.tableColumns.items() if attrIndex in attrIndexes},
+        context.outcomes, dataRowIndexes, validationRowIndexes,
+        context.bitsets)
+    potentials = _get_potentials(
+        [attrIndex for attrIndex in attrIndexes if
+         attrIndex not in continuousAttrIndexes], continuousAttrIndexes,
+        context.data, dataRowIndexes, context.outcomeIndex,
+        context.minimumSubsetSize, validationRowIndexes,
+        context.continuousSplitSearch, sortedIndexes, context.bins,
+        statistics)
+    bestPotentials = {}
+    for potential in potentials:
+        bestPotentials.setdefault(potential[1], potential)
+    return list(bestPotentials.values())
+
+
+def _get_table_columns(data, attrIndexes, continuousAttrIndexes, bins):
+    tableColumns = {attrIndex: data.column(attrIndex) for attrIndex in
+                    attrIndexes if attrIndex not in continuousAttrIndexes}
+    if bins is not None:
+        tableColumns.update((attrIndex, codes) for attrIndex, (edges, codes)
+                            in bins.items())
+    return tableColumns
+
+
+def _get_node_statistics(tableColumns, outcomes, rowIndexes,
+                         validationRowIndexes, bitsets=None):
+    if bitsets is None or not rowIndexes.is_dense():
+        return Counter(outcomes[i] for i in rowIndexes), \
+               {attrIndex: _get_contingency_table(column, outcomes,
+                                                  rowIndexes)
+                for attrIndex, column in tableColumns.items()}, \
+               {attrIndex: Counter(column[i] for i in validationRowIndexes)
+                for attrIndex, column in tableColumns.items()}
+    attrBitsets, outcomeBitsets = bitsets
+    rowBits = rowIndexes._bits
+    validationBits = validationRowIndexes._bits
+    outcomeCounts = Counter()
+    nodeOutcomeBitsets = []
+    for outcome, outcomeBits in outcomeBitsets.items():
+        outcomeBits &= rowBits
+        if outcomeBits != 0:
+            outcomeCounts[outcome] = outcomeBits.bit_count()
+            nodeOutcomeBitsets.append((outcome, outcomeBits))
+    tables = {}
+    validationCounts = {}
+    for attrIndex, column in tableColumns.items():
+        if attrIndex not in attrBitsets:
+            tables[attrIndex] = _get_contingency_table(column, outcomes,
+                                                       rowIndexes)
+            validationCounts[attrIndex] = Counter(
+                column[i] for i in validationRowIndexes)
+            continue
+        table = {}
+        attrValidationCounts = Counter()
+        for attrValue, valueBits in attrBitsets[attrIndex].items():
+            if validationBits != 0:
+                count = (valueBits & validationBits).bit_count()
+                if count > 0:
+                    attrValidationCounts[attrValue] = count
+            valueBits &= rowBits
+            if valueBits == 0:
+                continue
+            counts = {}
+            for outcome, outcomeBits in nodeOutcomeBitsets:
+                count = (valueBits & outcomeBits).bit_count()
+                if count > 0:
+                    counts[outcome] = count
+            table[attrValue] = counts
+        tables[attrIndex] = table
+        validationCounts[attrIndex] = attrValidationCounts
+    return outcomeCounts, tables, validationCounts
+
+
+def _subtract_node_statistics(statistics, childStatistics):
+    outcomeCounts, tables, validationCounts = statistics
+    childOutcomeCounts, childTables, childValidationCounts = \
+        childStatistics
+    siblingTables = {}
+    for attrIndex, table in tables.items():
+        childTable = childTables[attrIndex]
+        siblingTable = {}
+        for attrValue, counts in table.items():
+            childCounts = childTable.get(attrValue)
+            if childCounts is not None:
+                counts = {outcome: count - childCounts.get(outcome, 0) for
+                          outcome, count in counts.items() if
+                          count > childCounts.get(outcome, 0)}
+                if len(counts) == 0:
+                    continue
+            siblingTable[attrValue] = counts
+        siblingTables[attrIndex] = siblingTable
+    return outcomeCounts - childOutcomeCounts, siblingTables, \
+           {attrIndex: counts - childValidationCounts[attrIndex] for
+            attrIndex, counts in validationCounts.items()}
 
 
 def _get_potentials(attrIndexes, continuousAttrIndexes, data,
                     dataRowIndexes, outcomeIndex, minimumSubsetSize,
-                    validationRowIndexes):
-    uniqueAttributeValuePairs = {
-        (attrIndex, data[rowIndex][attrIndex], operator.eq)
-        for attrIndex in attrIndexes
-        if attrIndex not in continuousAttrIndexes
-        for rowIndex in dataRowIndexes}
-    continuousAttributeValuePairs = _get_continuous_av_pairs(
-        continuousAttrIndexes, data, dataRowIndexes)
-    uniqueAttributeValuePairs |= continuousAttributeValuePairs
-    potentials = sorted((-_get_bias(avPair, dataRowIndexes, data,
-                                    outcomeIndex, minimumSubsetSize,
-                                    validationRowIndexes),
-                         avPair[0], avPair[1], avPair[2])
-                        for avPair in uniqueAttributeValuePairs)
-    return potentials
-
-def _get_continuous_av_pairs(continuousAttrIndexes, data, dataRowIndexes):
-    avPairs = set()
+                    validationRowIndexes,
+                    continuousSplitSearch='center-out', sortedIndexes=None,
+                    bins=None, statistics=None):
+    data = as_dataset(data)
+    outcomes = data.column(outcomeIndex)
+    if statistics is None:
+        statistics = _get_node_statistics(
+            _get_table_columns(data, attrIndexes, continuousAttrIndexes,
+                               bins),
+            outcomes, dataRowIndexes, validationRowIndexes)
+    outcomeCounts, tables, validationCounts = statistics
+    potentials = []
+    for attrIndex in attrIndexes:
+        if attrIndex in continuousAttrIndexes:
+            continue
+        potentials.extend(
+            (-bias, attrIndex, attrValue, operator.eq)
+            for attrValue, bias in _get_contingency_biases(
+                tables[attrIndex], outcomeCounts, len(dataRowIndexes),
+                minimumSubsetSize, validationCounts[attrIndex],
+                len(validationRowIndexes)))
     for attrIndex in continuousAttrIndexes:
-        sortedAttrValues = [i for i in sorted(
-            data[rowIndex][attrIndex] for rowIndex in dataRowIndexes)]
-        indexes = _get_discontinuity_indexes(
-            sortedAttrValues,
-            max(math.sqrt(
-                len(sortedAttrValues)),
-                min(10,
-                    len(sortedAttrValues))))
-        for index in indexes:
-            avPairs.add((attrIndex, sortedAttrValues[index], operator.gt))
-    return avPairs
+        if bins is not None and attrIndex in bins:
+            potentials.extend(
+                (-bias, attrIndex, code, operator.gt)
+                for code, bias in _get_histogram_biases(
+                    tables[attrIndex], outcomeCounts, len(dataRowIndexes),
+                    minimumSubsetSize, validationCounts[attrIndex],
+                    len(validationRowIndexes)))
+            continue
+        column = data.column(attrIndex)
+        if sortedIndexes is not None:
+            sortedRowIndexes, sortedValidationRowIndexes = \
+                sortedIndexes[attrIndex]
+        else:
+            sortedRowIndexes = sorted(dataRowIndexes,
+                                      key=column.__getitem__)
+            sortedValidationRowIndexes = sorted(validationRowIndexes,
+                                                key=column.__getitem__)
+        sortedAttrValues = [column[i] for i in sortedRowIndexes]
+        if continuousSplitSearch == 'exhaustive':
+            indexes = None
+        else:
+            indexes = sorted(_get_discontinuity_indexes(
+                sortedAttrValues,
+                max(math.sqrt(
+                    len(sortedAttrValues)),
+                    min(10,
+                        len(sortedAttrValues)))))
+        potentials.extend(
+            (-bias, attrIndex, attrValue, operator.gt)
+            for attrValue, bias in _get_threshold_biases(
+                sortedAttrValues,
+                [outcomes[i] for i in sortedRowIndexes], indexes,
+                outcomeCounts, minimumSubsetSize,
+                [column[i] for i in sortedValidationRowIndexes]))
+    return sorted(potentials)
+
+
+def _get_contingency_table(column, outcomes, rowIndexes):
+    table = {}
+    for (attrValue, outcome), count in Counter(
+            (column[i], outcomes[i]) for i in rowIndexes).items():
+        outcomeCounts = table.get(attrValue)
+        if outcomeCounts is None:
+            outcomeCounts = table[attrValue] = {}
+        outcomeCounts[outcome] = count
+    return table
+
+
+def _get_contingency_biases(table, outcomeCounts, rowCount,
+                            minimumSubsetSize, validationCounts,
+                            validationCount):
+    for attrValue, matchOutcomeCounts in table.items():
+        if validationCount > 0:
+            validationMatchCount = validationCounts.get(attrValue, 0)
+            if validationMatchCount == 0 or \
+                    validationMatchCount == validationCount:
+                yield attrValue, -2
+                continue
+        matchCount = sum(matchOutcomeCounts.values())
+        nonMatchCount = rowCount - matchCount
+        if matchCount < minimumSubsetSize or \
+                nonMatchCount < minimumSubsetSize:
+            yield attrValue, -1
+            continue
+        numNonMatchOutcomes = sum(
+            1 for outcome, count in outcomeCounts.items()
+            if count > matchOutcomeCounts.get(outcome, 0))
+        yield attrValue, _get_bias_from_counts(
+            matchCount, nonMatchCount, len(matchOutcomeCounts) == 1,
+            numNonMatchOutcomes == 1)
+
+def _get_threshold_biases(sortedAttrValues, sortedOutcomes, indexes,
+                          outcomeCounts, minimumSubsetSize,
+                          sortedValidationValues):
+    rowCount = len(sortedAttrValues)
+    validationCount = len(sortedValidationValues)
+    nonMatchOutcomeCounts = {}
+    numMatchOutcomes = len(outcomeCounts)
+    validationNonMatchCount = 0
+    nextIndex = 0
+    for index in range(rowCount - 1):
+        outcome = sortedOutcomes[index]
+        count = nonMatchOutcomeCounts.get(outcome, 0) + 1
+        nonMatchOutcomeCounts[outcome] = count
+        if count == outcomeCounts[outcome]:
+            numMatchOutcomes -= 1
+        attrValue = sortedAttrValues[index]
+        if attrValue == sortedAttrValues[index + 1]:
+            continue
+        if indexes is not None:
+            if nextIndex == len(indexes):
+                break
+            if indexes[nextIndex] != index:
+                continue
+            nextIndex += 1
+        if validationCount > 0:
+            while validationNonMatchCount < validationCount and \
+                    sortedValidationValues[validationNonMatchCount] <= \
+                    attrValue:
+                validationNonMatchCount += 1
+            if validationNonMatchCount == 0 or \
+                    validationNonMatchCount == validationCount:
+                yield attrValue, -2
+                continue
+        nonMatchCount = index + 1
+        matchCount = rowCount - nonMatchCount
+        if matchCount < minimumSubsetSize or \
+                nonMatchCount < minimumSubsetSize:
+            yield attrValue, -1
+            continue
+        yield attrValue, _get_bias_from_counts(
+            matchCount, nonMatchCount, numMatchOutcomes == 1,
+            len(nonMatchOutcomeCounts) == 1)
+
+
+def _get_histogram_biases(table, outcomeCounts, rowCount, minimumSubsetSize,
+                          validationCounts, validationCount):
+    sortedValidationCounts = sorted(validationCounts.items())
+    nonMatchOutcomeCounts = {}
+    numMatchOutcomes = len(outcomeCounts)
+    nonMatchCount = 0
+    validationNonMatchCount = 0
+    validationIndex = 0
+    for code in sorted(table)[:-1]:
+        for outcome, count in table[code].items():
+            count += nonMatchOutcomeCounts.get(outcome, 0)
+            nonMatchOutcomeCounts[outcome] = count
+            if count == outcomeCounts[outcome]:
+                numMatchOutcomes -= 1
+        nonMatchCount += sum(table[code].values())
+        if validationCount > 0:
+            while validationIndex < len(sortedValidationCounts) and \
+                    sortedValidationCounts[validationIndex][0] <= code:
+                validationNonMatchCount += \
+                    sortedValidationCounts[validationIndex][1]
+                validationIndex += 1
+            if validationNonMatchCount == 0 or \
+                    validationNonMatchCount == validationCount:
+                yield code, -2
+                continue
+        matchCount = rowCount - nonMatchCount
+        if matchCount < minimumSubsetSize or \
+                nonMatchCount < minimumSubsetSize:
+            yield code, -1
+            continue
+        yield code, _get_bias_from_counts(
+            matchCount, nonMatchCount, numMatchOutcomes == 1,
+            len(nonMatchOutcomeCounts) == 1)
+
+
+def _get_bins(values, maxBins):
+    sortedValues = sorted(values)
+    if len(sortedValues) == 0:
+        return [], array('B', [0])
+    edges = sorted({sortedValues[min(len(sortedValues) - 1,
+                                     math.ceil(k * len(sortedValues) /
+                                               maxBins) - 1)]
+                    for k in range(1, maxBins + 1)})
+    codes = array('B', [0])
+    codes.extend(bisect_left(edges, value) for value in values)
+    return edges, codes
+
+
+def _partition_indexes(rowIndexes, column, isMatch, attrValue):
+    selectors = bytes(map(isMatch, map(column.__getitem__, rowIndexes),
+                          repeat(attrValue)))
+    return array('i', compress(rowIndexes, selectors)), \
+           array('i', compress(rowIndexes, map(operator.not_, selectors)))
 
 
 def _get_discontinuity_indexes(sortedAttrValues, maxIndexes):
@@ -223,19 +815,772 @@ def prepare_data(data, numericColumnLabels=None):
     return data
 
 
+def read_dataset(filepath, numericColumnLabels=None, chunkSize=10000,
+                 cache=False, cacheDirectory=None):
+    if not cache and cacheDirectory is None:
+        return _parse_dataset(filepath, numericColumnLabels, chunkSize)
+    if numericColumnLabels is not None:
+        numericColumnLabels = list(numericColumnLabels)
+    filepath = os.path.abspath(filepath)
+    key = hashlib.sha256(json.dumps(
+        [filepath, numericColumnLabels]).encode('utf-8')).hexdigest()
+    cachePath = os.path.join(
+        os.path.dirname(filepath) if cacheDirectory is None else
+        cacheDirectory,
+        '{}.{}.dataset'.format(os.path.basename(filepath), key[:16]))
+    status = os.stat(filepath)
+    fingerprint = {'path': filepath, 'size': status.st_size,
+                   'numericColumnLabels': numericColumnLabels}
+    dataset = _load_dataset_cache(cachePath, fingerprint, status.st_mtime_ns)
+    if dataset is not None:
+        return dataset
+    fingerprint['hash'] = _get_file_hash(filepath)
+    dataset = _parse_dataset(filepath, numericColumnLabels, chunkSize)
+    metadata = {'fingerprint': fingerprint, 'byteorder': sys.byteorder,
+                'header': dataset.header, 'values': dataset._values,
+                'integral': dataset._integral, 'columns': []}
+    chunks = [_DATASET_CACHE_MTIME.pack(status.st_mtime_ns)]
+    size = _DATASET_CACHE_MTIME.size
+    for column in dataset._columns:
+        metadata['columns'].append((size, column.typecode, len(column)))
+        chunks.append(_get_padded_bytes(column))
+        size += len(chunks[-1])
+    if cacheDirectory is not None:
+        os.makedirs(cacheDirectory, exist_ok=True)
+    _write_binary_file(cachePath, _DATASET_CACHE_MAGIC,
+                       _DATASET_CACHE_VERSION, metadata, chunks)
+    return dataset
+
+
+def _load_dataset_cache(cachePath, fingerprint, mtime):
+    try:
+        with open(cachePath, 'rb') as f:
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        metadata, dataOffset = _read_binary_metadata(
+            cachePath, content, _DATASET_CACHE_MAGIC, _DATASET_CACHE_VERSION)
+    except Exception:
+        return None
+    cached = metadata['fingerprint']
+    if any(cached[name] != fingerprint[name] for name in
+           ('path', 'size', 'numericColumnLabels')) or \
+            metadata['byteorder'] != sys.byteorder:
+        return None
+    if _DATASET_CACHE_MTIME.unpack_from(content, dataOffset)[0] != mtime:
+        if cached['hash'] != _get_file_hash(fingerprint['path']):
+            return None
+        try:
+            with open(cachePath, 'r+b') as f:
+                f.seek(dataOffset)
+                f.write(_DATASET_CACHE_MTIME.pack(mtime))
+        except OSError:
+            pass
+    buffer = memoryview(content).toreadonly()
+    columns = [buffer[dataOffset + offset:dataOffset + offset +
+                      length * array(typecode).itemsize].cast(typecode)
+               for offset, typecode, length in metadata['columns']]
+    return _new_dataset(metadata['header'], columns, metadata['values'],
+                        metadata['integral'])
+
+
+def _get_file_hash(filepath):
+    fileHash = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            fileHash.update(block)
+    return fileHash.hexdigest()
+
+
+def _parse_dataset(filepath, numericColumnLabels, chunkSize):
+    with open(filepath, 'r') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if numericColumnLabels is not None:
+            numericColumnIndexes = {header.index(label) for label in
+                                    numericColumnLabels}
+        else:
+            numericColumnIndexes = _get_numeric_column_indexes(
+                reader, len(header), chunkSize)
+            f.seek(0)
+            reader = csv.reader(f)
+            next(reader)
+        columns = [array('d', [math.nan]) if attrIndex in numericColumnIndexes
+                   else array('i', [-1]) for attrIndex in range(len(header))]
+        codes = [None if attrIndex in numericColumnIndexes else {}
+                 for attrIndex in range(len(header))]
+        while True:
+            rows = list(islice(reader, chunkSize))
+            if len(rows) == 0:
+                break
+            for attrIndex, column in enumerate(columns):
+                cells = map(operator.itemgetter(attrIndex), rows)
+                if codes[attrIndex] is None:
+                    column.extend(map(_parse_number, cells))
+                    continue
+                attrCodes = codes[attrIndex]
+                column.extend(attrCodes[cell] if cell in attrCodes else
+                              attrCodes.setdefault(cell, len(attrCodes))
+                              for cell in cells)
+    values = []
+    for attrIndex, column in enumerate(columns):
+        if codes[attrIndex] is None:
+            values.append(None)
+            continue
+        attrValues = sorted(codes[attrIndex])
+        recoded = array('i', [0] * len(attrValues))
+        for code, value in enumerate(attrValues):
+            recoded[codes[attrIndex][value]] = code
+        codes[attrIndex] = None
+        columns[attrIndex] = array('i', [-1])
+        columns[attrIndex].extend(map(recoded.__getitem__, column[1:]))
+        values.append(attrValues)
+    return _new_dataset(header, columns, values,
+                        [attrValues is None for attrValues in values])
+
+
+def _get_numeric_column_indexes(reader, columnCount, chunkSize):
+    numericColumnIndexes = set(range(columnCount))
+    hasNumbers = set()
+    while len(numericColumnIndexes) > 0:
+        rows = list(islice(reader, chunkSize))
+        if len(rows) == 0:
+            break
+        for attrIndex in list(numericColumnIndexes):
+            for cell in map(operator.itemgetter(attrIndex), rows):
+                if len(cell) == 0:
+                    continue
+                try:
+                    float(cell)
+                except ValueError:
+                    numericColumnIndexes.remove(attrIndex)
+                    break
+                hasNumbers.add(attrIndex)
+    return numericColumnIndexes & hasNumbers
+
+
+def _parse_number(cell):
+    return float(cell) if len(cell) > 0 else 0.0
+
+
+class RowArray:
+    def __init__(self, rowIndexes=(), isSorted=False):
+        if not isSorted:
+            rowIndexes = sorted(rowIndexes)
+        self._indexes = rowIndexes if isinstance(rowIndexes, array) else \
+            array('i', rowIndexes)
+
+    def __len__(self):
+        return len(self._indexes)
+
+    def __iter__(self):
+        return iter(self._indexes)
+
+    def partition(self, column, isMatch, attrValue):
+        matches, nonMatches = _partition_indexes(self._indexes, column,
+                                                 isMatch, attrValue)
+        return RowArray(matches, True), RowArray(nonMatches, True)
+
+    @staticmethod
+    def is_dense():
+        return False
+
+
+class RowBitmap:
+    def __init__(self, rowIndexes=()):
+        if isinstance(rowIndexes, int):
+            self._bits = rowIndexes
+            return
+        rowIndexes = list(rowIndexes)
+        flags = bytearray((max(rowIndexes, default=0) >> 3) + 1)
+        for rowIndex in rowIndexes:
+            flags[rowIndex >> 3] |= 1 << (rowIndex & 7)
+        self._bits = int.from_bytes(flags, 'little')
+
+    def __len__(self):
+        return self._bits.bit_count()
+
+    def __iter__(self):
+        flags = self._bits.to_bytes((self._bits.bit_length() + 7) >> 3,
+                                    'little')
+        return iter([(match.start() << 3) + bit
+                     for match in _NONZERO_BYTES.finditer(flags)
+                     for bit in _BIT_POSITIONS[flags[match.start()]]])
+
+    def partition(self, column, isMatch, attrValue):
+        matches = RowBitmap(i for i in self if
+                            isMatch(column[i], attrValue))
+        return matches, RowBitmap(self._bits & ~matches._bits)
+
+    def split(self, bits):
+        return RowBitmap(self._bits & bits), RowBitmap(self._bits & ~bits)
+
+    def is_dense(self):
+        return len(self) * _MIN_BITMAP_DENSITY >= self._bits.bit_length()
+
+
+_NONZERO_BYTES = re.compile(b'[^\\x00]')
+
+_BIT_POSITIONS = [tuple(bit for bit in range(8) if byte & (1 << bit))
+                  for byte in range(256)]
+
+_MIN_BITMAP_DENSITY = 64
+
+_ROW_SELECTIONS = {'array': RowArray, 'bitmap': RowBitmap}
+
+
+def _get_value_bitsets(column, rowCount):
+    flags = {}
+    for rowIndex in range(1, rowCount):
+        value = column[rowIndex]
+        valueFlags = flags.get(value)
+        if valueFlags is None:
+            valueFlags = flags[value] = bytearray((rowCount >> 3) + 1)
+        valueFlags[rowIndex >> 3] |= 1 << (rowIndex & 7)
+    return {value: int.from_bytes(valueFlags, 'little') for
+            value, valueFlags in flags.items()}
+
+
+def as_rows(rowIndexes, rowSelection='array'):
+    if isinstance(rowIndexes, (RowArray, RowBitmap)):
+        return rowIndexes
+    return _ROW_SELECTIONS[rowSelection](rowIndexes)
+
+
+class Dataset:
+
+    def __init__(self, data, continuousAttributes=None):
+        self.header = list(data[0])
+        if continuousAttributes is not None:
+            numericIndexes = {self.header.index(label) for label in
+                              continuousAttributes}
+        else:
+            numericIndexes = {
+                attrIndex for attrIndex in range(len(self.header))
+                if all(isinstance(row[attrIndex], Number)
+                       for rowIndex, row in enumerate(data) if rowIndex > 0)}
+        self._columns = []
+        self._values = []
+        self._integral = []
+        self._bins = {}
+        self._valueBitsets = {}
+        self._sharedMemory = None
+        self._finalizer = None
+        for attrIndex in range(len(self.header)):
+            if attrIndex in numericIndexes:
+                column = array('d', [math.nan])
+                column.extend(float(row[attrIndex]) for rowIndex, row in
+                              enumerate(data) if rowIndex > 0)
+                values = None
+                integral = not any(
+                    isinstance(row[attrIndex], float) and
+                    row[attrIndex].is_integer()
+                    for rowIndex, row in enumerate(data) if rowIndex > 0)
+            else:
+                values = {row[attrIndex] for rowIndex, row in
+                          enumerate(data) if rowIndex > 0}
+                try:
+                    values = sorted(values)
+                except TypeError:
+                    values = list(values)
+                codes = {value: code for code, value in enumerate(values)}
+                column = array('i', [-1])
+                column.extend(codes[row[attrIndex]] for rowIndex, row in
+                              enumerate(data) if rowIndex > 0)
+                integral = False
+            self._columns.append(column)
+            self._values.append(values)
+            self._integral.append(integral)
+
+    def __len__(self):
+        return len(self._columns[0]) if len(self._columns) > 0 else 1
+
+    def __getitem__(self, rowIndex):
+        if rowIndex == 0:
+            return self.header
+        return [self.decode(attrIndex, column[rowIndex]) for
+                attrIndex, column in enumerate(self._columns)]
+
+    def column(self, attrIndex):
+        return self._columns[attrIndex]
+
+    def get_bins(self, attrIndex, maxBins):
+        key = (attrIndex, maxBins)
+        if key not in self._bins:
+            self._bins[key] = _get_bins(self._columns[attrIndex][1:],
+                                        maxBins)
+        return self._bins[key]
+
+    def get_value_bitsets(self, attrIndex):
+        if attrIndex not in self._valueBitsets:
+            self._valueBitsets[attrIndex] = _get_value_bitsets(
+                self._columns[attrIndex], len(self))
+        return self._valueBitsets[attrIndex]
+
+    def is_numeric(self, attrIndex):
+        return self._values[attrIndex] is None
+
+    def get_rows(self, attrIndexes):
+        columns = [repeat(None, len(self) - 1) for _ in
+                   range(max(attrIndexes, default=0) + 1)]
+        for attrIndex in attrIndexes:
+            column = islice(self._columns[attrIndex], 1, None)
+            values = self._values[attrIndex]
+            columns[attrIndex] = column if values is None else \
+                map(values.__getitem__, column)
+        return list(zip(*columns))
+
+    def decode(self, attrIndex, value):
+        if self._values[attrIndex] is not None:
+            return self._values[attrIndex][value]
+        if self._integral[attrIndex] and value.is_integer():
+            return int(value)
+        return value
+
+    def share(self):
+        layout = []
+        size = 0
+        for column in self._columns:
+            column = memoryview(column)
+            size += -size % 8
+            layout.append((size, column.format, len(column)))
+            size += column.nbytes
+        sharedMemory = shared_memory.SharedMemory(create=True,
+                                                  size=max(size, 1))
+        for column, (offset, typecode, length) in zip(self._columns,
+                                                      layout):
+            column = memoryview(column).cast('B')
+            sharedMemory.buf[offset:offset + len(column)] = column
+        return _attach_dataset(sharedMemory, self.header, self._values,
+                               self._integral, layout, True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_columns'] = [
+            column if isinstance(column, array) else
+            array(memoryview(column).format, column)
+            for column in self._columns]
+        return state
+
+    def close(self):
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def __reduce_ex__(self, protocol):
+        if self._sharedMemory is None:
+            return super().__reduce_ex__(protocol)
+        return _attach_shared_dataset, (self._sharedMemory.name, self.header,
+                                        self._values, self._integral,
+                                        self._layout)
+
+
+def _attach_shared_dataset(name, header, values, integral, layout):
+    return _attach_dataset(shared_memory.SharedMemory(name=name), header,
+                           values, integral, layout, False)
+
+
+def _new_dataset(header, columns, values, integral):
+    dataset = Dataset.__new__(Dataset)
+    dataset.header = header
+    dataset._columns = columns
+    dataset._values = values
+    dataset._integral = integral
+    dataset._bins = {}
+    dataset._valueBitsets = {}
+    dataset._sharedMemory = None
+    dataset._finalizer = None
+    return dataset
+
+
+def _attach_dataset(sharedMemory, header, values, integral, layout,
+                    isOwner):
+    buffer = sharedMemory.buf.toreadonly()
+    views = [buffer]
+    columns = []
+    for offset, typecode, length in layout:
+        view = buffer[offset:offset + length * array(typecode).itemsize]
+        column = view.cast(typecode)
+        views.extend((view, column))
+        columns.append(column)
+    dataset = _new_dataset(header, columns, values, integral)
+    dataset._layout = layout
+    dataset._sharedMemory = sharedMemory
+    dataset._finalizer = weakref.finalize(dataset, _release_shared_memory,
+                                          sharedMemory, views, isOwner)
+    return dataset
+
+
+def _release_shared_memory(sharedMemory, views, unlink):
+    for view in reversed(views):
+        view.release()
+    sharedMemory.close()
+    if unlink:
+        sharedMemory.unlink()
+
+
+class _ListDataset:
+
+    def __init__(self, data):
+        self._data = data
+        self.header = data[0]
+        self._bins = {}
+        self._valueBitsets = {}
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, rowIndex):
+        return self._data[rowIndex]
+
+    def column(self, attrIndex):
+        return _ColumnView(self._data, attrIndex)
+
+    def get_bins(self, attrIndex, maxBins):
+        key = (attrIndex, maxBins)
+        if key not in self._bins:
+            self._bins[key] = _get_bins(
+                [row[attrIndex] for rowIndex, row in enumerate(self._data)
+                 if rowIndex > 0], maxBins)
+        return self._bins[key]
+
+    def get_value_bitsets(self, attrIndex):
+        if attrIndex not in self._valueBitsets:
+            self._valueBitsets[attrIndex] = _get_value_bitsets(
+                self.column(attrIndex), len(self))
+        return self._valueBitsets[attrIndex]
+
+    def is_numeric(self, attrIndex):
+        return all(isinstance(row[attrIndex], Number) for rowIndex, row in
+                   enumerate(self._data) if rowIndex > 0)
+
+    @staticmethod
+    def decode(attrIndex, value):
+        return value
+
+
+class _ColumnView:
+    __slots__ = ('_data', '_attrIndex')
+
+    def __init__(self, data, attrIndex):
+        self._data = data
+        self._attrIndex = attrIndex
+
+    def __len__(self):
+        return len(self._data)
+
+    def __getitem__(self, rowIndex):
+        return self._data[rowIndex][self._attrIndex]
+
+
+def as_dataset(data):
+    if isinstance(data, (Dataset, _ListDataset)):
+        return data
+    return _ListDataset(data)
+
+
+def _get_literal(value, constants):
+    if type(value) in (int, str) or \
+            type(value) is float and math.isfinite(value):
+        return repr(value)
+    return _get_constant_name(value, constants)
+
+
+def _get_constant_name(value, constants):
+    name = '_constant_{}'.format(len(constants))
+    constants[name] = value
+    return name
+
+
+class PredictionCache:
+    def __init__(self, attrIndexes, maxSize):
+        self.attrIndexes = attrIndexes
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._get_key = operator.itemgetter(*attrIndexes) \
+            if len(attrIndexes) > 0 else _get_empty_key
+
+    def __len__(self):
+        return len(self._entries)
+
+    def lookup(self, data, compute):
+        key = self._get_key(data)
+        value = self._entries.get(key, _MISSING)
+        if value is not _MISSING:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return value
+        self.misses += 1
+        value = self._entries[key] = compute(data)
+        if len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+
+def _get_empty_key(data):
+    return ()
+
+
+_MISSING = object()
+
+_OP_LEAF = 0
+_OP_EQ = 1
+_OP_GT = 2
+
+_OPCODES = {operator.eq: _OP_EQ, operator.gt: _OP_GT}
+
+_OPERATORS = {_OP_EQ: operator.eq, _OP_GT: operator.gt}
+
+_OPERATOR_SYMBOLS = {_OP_EQ: '==', _OP_GT: '>'}
+
+_TREE_ARRAYS = (('_features', 'i'), ('_opcodes', 'b'), ('_valueIndexes', 'i'),
+                ('_matchIds', 'i'), ('_nonMatchIds', 'i'),
+                ('_matchCounts', 'i'), ('_nonMatchCounts', 'i'))
+
+_LEAF_ARRAYS = (('_leafValueIds', 'i'), ('_leafOffsets', 'i'),
+                ('_leafOutcomes', 'i'), ('_leafPercentages', 'd'),
+                ('_leafCumulativePercentages', 'd'))
+
+_MODEL_MAGIC = b'TBMLMODL'
+
+_MODEL_VERSION = 3
+
+_FILE_HEADER = struct.Struct('<8sII')
+
+_DATASET_CACHE_MAGIC = b'TBMLDATA'
+
+_DATASET_CACHE_VERSION = 3
+
+_DATASET_CACHE_MTIME = struct.Struct('<q')
+
+_MODEL_VALUE_TYPES = (str, int, float, bool, type(None))
+
+_MAX_COMPILED_DEPTH = 40
+
+_MIN_COMPILED_BATCH_ROWS_PER_NODE = 10
+
+
 class DTree:
     def __init__(self, nodes, attrNames, outcomeIsContinuous=False):
-        self._nodes = nodes
         self._attrNames = attrNames
         self._outcomeIsContinuous = outcomeIsContinuous
+        self.profile = None
+        self.cache = None
+        self._compiled = None
+        self._features = array('i')
+        self._opcodes = array('b')
+        self._valueIndexes = array('i')
+        self._matchIds = array('i')
+        self._nonMatchIds = array('i')
+        self._matchCounts = array('i')
+        self._nonMatchCounts = array('i')
+        self._values = []
+        valueIds = {}
+        leaves = []
+        for node in nodes:
+            if self._is_leaf(node):
+                self._append(-1, _OP_LEAF, len(leaves), -1, -1, 0, 0)
+                leaves.append(_get_leaf_ids(node[1], self._values, valueIds))
+                continue
+            nodeId, attrIndex, attrValue, isMatch, nodeIdIfMatch, \
+                nodeIdIfNonMatch, matchCount, nonMatchCount = node
+            self._append(attrIndex, _OPCODES[isMatch],
+                         _intern_value(attrValue, self._values, valueIds),
+                         nodeIdIfMatch, nodeIdIfNonMatch, matchCount,
+                         nonMatchCount)
+        self._root = 0
+        self._nodeCount = len(self._opcodes)
+        self._set_leaves(leaves)
+
+    def _append(self, attrIndex, opcode, valueIndex, nodeIdIfMatch,
+                nodeIdIfNonMatch, matchCount, nonMatchCount):
+        self._features.append(attrIndex)
+        self._opcodes.append(opcode)
+        self._valueIndexes.append(valueIndex)
+        self._matchIds.append(nodeIdIfMatch)
+        self._nonMatchIds.append(nodeIdIfNonMatch)
+        self._matchCounts.append(matchCount)
+        self._nonMatchCounts.append(nonMatchCount)
+
+    def _set_leaves(self, leaves):
+        self._leafValueIds = array('i')
+        self._leafOffsets = array('i', [0])
+        self._leafOutcomes = array('i')
+        self._leafPercentages = array('d')
+        self._leafCumulativePercentages = array('d')
+        self._leafBase = 0
+        self._leafCount = len(leaves)
+        for leaf in leaves:
+            if type(leaf) is not list:
+                self._leafValueIds.append(leaf)
+                self._leafOffsets.append(len(self._leafOutcomes))
+                continue
+            self._leafOutcomes.extend(outcomeId for outcomeId, _ in leaf)
+            self._leafPercentages.extend(percentage for _, percentage in leaf)
+            self._leafCumulativePercentages.extend(
+                accumulate(percentage for _, percentage in leaf))
+            self._leafOffsets.append(len(self._leafOutcomes))
+            if not self._outcomeIsContinuous:
+                self._leafValueIds.append(-1)
+                continue
+            leaf = sorted(leaf, key=lambda n: self._values[n[0]])
+            cumulativePercentages = list(
+                accumulate(percentage for _, percentage in leaf))
+            self._leafValueIds.append(leaf[min(
+                bisect_right(cumulativePercentages, .5), len(leaf) - 1)][0])
+
+    def _copy_into(self, tables, values, valueIds):
+        def get_value_id(valueId):
+            return _intern_value(self._values[valueId], values, valueIds)
+
+        root = len(tables['_opcodes'])
+        leafBase = len(tables['_leafValueIds'])
+        nodes = slice(self._root, self._root + self._nodeCount)
+        leaves = slice(self._leafBase, self._leafBase + self._leafCount)
+        start = self._leafOffsets[self._leafBase]
+        end = self._leafOffsets[self._leafBase + self._leafCount]
+        opcodes = self._opcodes[nodes]
+        tables['_features'].extend(self._features[nodes])
+        tables['_opcodes'].extend(opcodes)
+        tables['_valueIndexes'].extend(
+            valueIndex - self._leafBase + leafBase if opcode == _OP_LEAF else
+            get_value_id(valueIndex) for opcode, valueIndex in
+            zip(opcodes, self._valueIndexes[nodes]))
+        for name in ('_matchIds', '_nonMatchIds'):
+            tables[name].extend(
+                nodeId if opcode == _OP_LEAF else nodeId - self._root + root
+                for opcode, nodeId in zip(opcodes, getattr(self, name)[nodes]))
+        tables['_matchCounts'].extend(self._matchCounts[nodes])
+        tables['_nonMatchCounts'].extend(self._nonMatchCounts[nodes])
+        tables['_leafValueIds'].extend(
+            valueId if valueId < 0 else get_value_id(valueId) for valueId in
+            self._leafValueIds[leaves])
+        shift = len(tables['_leafOutcomes']) - start
+        tables['_leafOffsets'].extend(
+            offset + shift for offset in
+            self._leafOffsets[self._leafBase + 1:
+                              self._leafBase + self._leafCount + 1])
+        tables['_leafOutcomes'].extend(
+            map(get_value_id, self._leafOutcomes[start:end]))
+        tables['_leafPercentages'].extend(self._leafPercentages[start:end])
+        tables['_leafCumulativePercentages'].extend(
+            self._leafCumulativePercentages[start:end])
+        return root, self._nodeCount, leafBase, self._leafCount
+
+    def _set_tables(self, tables, values, root, nodeCount, leafBase,
+                    leafCount):
+        for name, _ in _TREE_ARRAYS + _LEAF_ARRAYS:
+            setattr(self, name, tables[name])
+        self._values = values
+        self._root = root
+        self._nodeCount = nodeCount
+        self._leafBase = leafBase
+        self._leafCount = leafCount
+        self._compiled = None
+        if self.cache is not None:
+            self.cache.clear()
+
+    def _get_leaf_node(self, leafIndex):
+        start = self._leafOffsets[leafIndex]
+        end = self._leafOffsets[leafIndex + 1]
+        if start == end:
+            return self._values[self._leafValueIds[leafIndex]]
+        return [(self._values[outcomeId], percentage) for
+                outcomeId, percentage in
+                zip(self._leafOutcomes[start:end],
+                    self._leafPercentages[start:end])]
 
     @staticmethod
     def _is_leaf(node):
         return len(node) == 2
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_compiled'] = None
+        state['_values'] = []
+        tables, ranges = _pack_trees([self], state['_values'], {})
+        state.update(tables)
+        state.update(zip(('_root', '_nodeCount', '_leafBase', '_leafCount'),
+                         ranges[0]))
+        return state
+
+    def compile(self):
+        if self._compiled is None:
+            self._compiled = self._compile()
+        return self._compiled
+
+    def _compile(self):
+        constants = {'_get_leaf_prediction': self.get_leaf_prediction,
+                     '_random': random}
+        lines = []
+        functionIds = [self._root]
+        while len(functionIds) > 0:
+            functionId = functionIds.pop()
+            lines.append('def _predict_{}(data, rng=_random):'.format(
+                functionId))
+            self._compile_node(functionId, 1, lines, constants, functionIds)
+        namespace = dict(constants)
+        exec(compile('\n'.join(lines), '<DTree>', 'exec'), namespace)
+        return namespace['_predict_{}'.format(self._root)]
+
+    def _compile_node(self, nodeId, depth, lines, constants, functionIds):
+        indent = '    ' * depth
+        while True:
+            opcode = self._opcodes[nodeId]
+            if opcode == _OP_LEAF:
+                leafIndex = self._valueIndexes[nodeId]
+                valueId = self._leafValueIds[leafIndex]
+                if valueId < 0:
+                    lines.append(
+                        '{}return _get_leaf_prediction({}, rng)'.format(
+                            indent, leafIndex))
+                else:
+                    lines.append('{}return {}'.format(
+                        indent, _get_literal(self._values[valueId],
+                                             constants)))
+                return
+            if depth >= _MAX_COMPILED_DEPTH:
+                lines.append('{}return _predict_{}(data, rng)'.format(
+                    indent, nodeId))
+                functionIds.append(nodeId)
+                return
+            lines.append('{}if data[{}] {} {}:'.format(
+                indent, self._features[nodeId], _OPERATOR_SYMBOLS[opcode],
+                _get_literal(self._values[self._valueIndexes[nodeId]],
+                             constants)))
+            self._compile_node(self._matchIds[nodeId], depth + 1, lines,
+                               constants, functionIds)
+            nodeId = self._nonMatchIds[nodeId]
+
+    def save(self, path):
+        save_trees(path, [self], kind='tree')
+
+    def get_nodes(self):
+        nodes = []
+        root = self._root
+        for nodeId in range(root, root + self._nodeCount):
+            opcode = self._opcodes[nodeId]
+            if opcode == _OP_LEAF:
+                nodes.append((nodeId - root,
+                              self._get_leaf_node(
+                                  self._valueIndexes[nodeId])))
+                continue
+            nodes.append((nodeId - root, self._features[nodeId],
+                          self._values[self._valueIndexes[nodeId]],
+                          _OPERATORS[opcode], self._matchIds[nodeId] - root,
+                          self._nonMatchIds[nodeId] - root,
+                          self._matchCounts[nodeId],
+                          self._nonMatchCounts[nodeId]))
+        return nodes
+
     def __str__(self):
         s = ''
-        for node in self._nodes:
+        for node in self.get_nodes():
             if self._is_leaf(node):
                 s += '{}: {}\n'.format(node[0], node[1])
             else:
@@ -247,24 +1592,227 @@ class DTree:
                     nonMatchCount, '=' if isMatch == operator.eq else '>')
         return s
 
-    def get_prediction(self, data):
-        currentNode = self._nodes[0]
+    def get_prediction(self, data, rng=random):
+        if self.cache is not None:
+            return self.get_leaf_prediction(
+                self.cache.lookup(data, self.get_leaf_index), rng)
+        if self._compiled is not None:
+            return self._compiled(data, rng)
+        return self.get_leaf_prediction(self.get_leaf_index(data), rng)
+
+    def get_leaf_index(self, data):
+        opcodes = self._opcodes
+        features = self._features
+        valueIndexes = self._valueIndexes
+        values = self._values
+        nodeId = self._root
         while True:
-            if self._is_leaf(currentNode):
-                node = currentNode[1]
-                if type(node) is not list:
-                    return node
-                if self._outcomeIsContinuous:
-                    node = sorted(node, key=lambda n: n[0])
-                randPercent = .5 if self._outcomeIsContinuous else \
-                    random.uniform(0, 1)
-                total = 0
-                for outcome, percentage in node:
-                    total += percentage
-                    if total > randPercent:
-                        return outcome
-                return node[-1][0]
-            nodeId, attrIndex, attrValue, isMatch, nodeIdIfMatch, \
-                nodeIdIfNonMatch = currentNode[:6]
-            currentNode = self._nodes[nodeIdIfMatch if
-                isMatch(data[attrIndex], attrValue) else nodeIdIfNonMatch]
+            opcode = opcodes[nodeId]
+            if opcode == _OP_EQ:
+                nodeId = self._matchIds[nodeId] if \
+                    data[features[nodeId]] == \
+                    values[valueIndexes[nodeId]] else \
+                    self._nonMatchIds[nodeId]
+            elif opcode == _OP_GT:
+                nodeId = self._matchIds[nodeId] if \
+                    data[features[nodeId]] > \
+                    values[valueIndexes[nodeId]] else \
+                    self._nonMatchIds[nodeId]
+            else:
+                return valueIndexes[nodeId]
+
+    def enable_cache(self, maxSize=10000):
+        self.cache = PredictionCache(self.get_split_attr_indexes(), maxSize)
+
+    def disable_cache(self):
+        self.cache = None
+
+    def get_split_attr_indexes(self):
+        nodes = slice(self._root, self._root + self._nodeCount)
+        return sorted({attrIndex for attrIndex, opcode in
+                       zip(self._features[nodes], self._opcodes[nodes])
+                       if opcode != _OP_LEAF})
+
+    def predict_many(self, rows, rng=random):
+        if isinstance(rows, Dataset):
+            rows = rows.get_rows(self.get_split_attr_indexes())
+        predict = self._compiled
+        if predict is None:
+            predict = self._compile() if len(rows) >= \
+                _MIN_COMPILED_BATCH_ROWS_PER_NODE * self._nodeCount \
+                else self.get_prediction
+        return list(map(predict, rows, repeat(rng)))
+
+    def get_leaf_prediction(self, leafIndex, rng=random):
+        valueId = self._leafValueIds[leafIndex]
+        if valueId >= 0:
+            return self._values[valueId]
+        end = self._leafOffsets[leafIndex + 1]
+        index = bisect_right(self._leafCumulativePercentages,
+                             rng.uniform(0, 1),
+                             self._leafOffsets[leafIndex], end)
+        return self._values[self._leafOutcomes[min(index, end - 1)]]
+
+
+def _intern_value(value, values, valueIds):
+    key = (type(value), value)
+    valueId = valueIds.get(key)
+    if valueId is None:
+        valueId = valueIds[key] = len(values)
+        values.append(value)
+    return valueId
+
+
+def _get_leaf_ids(leaf, values, valueIds):
+    if type(leaf) is not list:
+        return _intern_value(leaf, values, valueIds)
+    return [(_intern_value(outcome, values, valueIds), percentage) for
+            outcome, percentage in leaf]
+
+
+def intern_values(trees):
+    values = []
+    tables, ranges = _pack_trees(trees, values, {})
+    for tree, treeRange in zip(trees, ranges):
+        tree._set_tables(tables, values, *treeRange)
+    return values
+
+
+def _pack_trees(trees, values, valueIds):
+    tables = {name: array(typecode) for name, typecode in
+              _TREE_ARRAYS + _LEAF_ARRAYS}
+    tables['_leafOffsets'].append(0)
+    ranges = [tree._copy_into(tables, values, valueIds) for tree in trees]
+    return tables, ranges
+
+
+def load(path, mapped=False):
+    metadata, trees = load_trees(path, mapped)
+    if metadata['kind'] != 'tree':
+        raise Exception('{} does not contain a tree'.format(path))
+    return trees[0]
+
+
+def save_trees(path, trees, **metadata):
+    values = []
+    tables, ranges = _pack_trees(trees, values, {})
+    for value in values:
+        if type(value) not in _MODEL_VALUE_TYPES:
+            raise Exception('cannot save value {!r}'.format(value))
+    directory = [{'root': root, 'nodeCount': nodeCount,
+                  'leafBase': leafBase, 'leafCount': leafCount,
+                  'outcomeIsContinuous': tree._outcomeIsContinuous}
+                 for tree, (root, nodeCount, leafBase, leafCount) in
+                 zip(trees, ranges)]
+    metadata.update(attrNames=trees[0]._attrNames if len(trees) > 0 else [],
+                    byteorder=sys.byteorder, values=values, trees=directory,
+                    arrays=[])
+    chunks = []
+    size = 0
+    for name, typecode in _TREE_ARRAYS + _LEAF_ARRAYS:
+        metadata['arrays'].append((name, size, typecode, len(tables[name])))
+        chunks.append(_get_padded_bytes(tables[name]))
+        size += len(chunks[-1])
+    _write_binary_file(path, _MODEL_MAGIC, _MODEL_VERSION, metadata, chunks)
+
+
+def load_trees(path, mapped=False):
+    with open(path, 'rb') as f:
+        if mapped:
+            content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            content = f.read()
+    metadata, dataOffset = _read_binary_metadata(path, content, _MODEL_MAGIC,
+                                                 _MODEL_VERSION)
+    tables = _read_tables(content, metadata, dataOffset)
+    if mapped:
+        return metadata, MappedTrees(path, metadata, tables)
+    return metadata, [_read_tree(metadata, tables, entry)
+                      for entry in metadata['trees']]
+
+
+def _read_tables(content, metadata, dataOffset):
+    isMapped = isinstance(content, mmap.mmap) and \
+        metadata['byteorder'] == sys.byteorder
+    tables = {}
+    for name, offset, typecode, length in metadata['arrays']:
+        table = array(typecode)
+        start = dataOffset + offset
+        end = start + length * table.itemsize
+        if isMapped:
+            table = memoryview(content)[start:end].cast(typecode)
+        else:
+            table.frombytes(content[start:end])
+            if metadata['byteorder'] != sys.byteorder:
+                table.byteswap()
+        tables[name] = table
+    return tables
+
+
+def _read_tree(metadata, tables, entry):
+    tree = DTree.__new__(DTree)
+    tree._attrNames = metadata['attrNames']
+    tree._outcomeIsContinuous = entry['outcomeIsContinuous']
+    tree.profile = None
+    tree.cache = None
+    tree._set_tables(tables, metadata['values'], entry['root'],
+                     entry['nodeCount'], entry['leafBase'],
+                     entry['leafCount'])
+    return tree
+
+
+class MappedTrees:
+    def __init__(self, path, metadata, tables):
+        self.path = path
+        self._metadata = metadata
+        self._tables = tables
+        self._trees = [None] * len(metadata['trees'])
+
+    def __len__(self):
+        return len(self._trees)
+
+    def __getitem__(self, index):
+        tree = self._trees[index]
+        if tree is None:
+            tree = self._trees[index] = _read_tree(
+                self._metadata, self._tables, self._metadata['trees'][index])
+        return tree
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self._trees)))
+
+    def __reduce__(self):
+        return _map_trees, (self.path,)
+
+
+def _map_trees(path):
+    return load_trees(path, True)[1]
+
+
+def _get_padded_bytes(column):
+    chunk = memoryview(column).tobytes()
+    return chunk + bytes(-len(chunk) % 8)
+
+
+def _write_binary_file(path, magic, version, metadata, chunks):
+    encoded = json.dumps(metadata).encode('utf-8')
+    encoded += b' ' * (-(_FILE_HEADER.size + len(encoded)) % 8)
+    temporaryPath = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temporaryPath, 'wb') as f:
+        f.write(_FILE_HEADER.pack(magic, version, len(encoded)))
+        f.write(encoded)
+        f.writelines(chunks)
+    os.replace(temporaryPath, path)
+
+
+def _read_binary_metadata(path, content, magic, version):
+    if len(content) < _FILE_HEADER.size:
+        raise Exception('{} is not a {} file'.format(path, magic.decode()))
+    fileMagic, fileVersion, metadataLength = _FILE_HEADER.unpack_from(content)
+    if fileMagic != magic:
+        raise Exception('{} is not a {} file'.format(path, magic.decode()))
+    if fileVersion != version:
+        raise Exception('unsupported {} version {}'.format(magic.decode(),
+                                                           fileVersion))
+    dataOffset = _FILE_HEADER.size + metadataLength
+    return json.loads(content[_FILE_HEADER.size:dataOffset]), dataOffset
@@ -15,17 +15,21 @@
 # implied.  See the License for the specific language governing
 # permissions and limitations under the License.
 
+import copy
 import dtree
 import math
 import random
 import statistics
 import operator
+from concurrent.futures import ProcessPoolExecutor
 
 class Forest:
     def __init__(self, data, outcomeLabel, continuousAttributes=None,
                  dataRowIndexes=None, columnsNamesToIgnore=None,
-                 boost=False):
+                 boost=False, maxBins=None, rowSelection='array',
+                 numJobs=None, seed=None):
         self.data = data
+        self._dataset = dtree.as_dataset(data)
         self.outcomeLabel = outcomeLabel
         self.continuousAttributes = continuousAttributes \
             if columnsNamesToIgnore is None \
@@ -45,35 +49,75 @@ class Forest:
             data)) if dataRowIndexes is None else dataRowIndexes
         self.numTrees = 200
         self.boost = boost
+        self.maxBins = maxBins
+        self.rowSelection = rowSelection
+        self.numJobs = numJobs
+        self.seed = random.getrandbits(64) if seed is None else seed
+        self._random = random.Random(self.seed)
         self.weights = [.5 for _ in range(0, self.numTrees)]
+        self._voteOrder = None
+        self.cache = None
         self.populate()
 
-    def _build_tree(self):
-        return dtree.build(self.data, self.outcomeLabel,
+    def _build_tree(self, treeSeed):
+        treeRandom = random.Random(treeSeed)
+        return dtree.build(self._dataset, self.outcomeLabel,
                            continuousAttributes=self.continuousAttributes,
-                           dataIndexes={i for i in random.sample(
-                               self.dataRowIndexes, self.numRows)},
+                           maxBins=self.maxBins,
+                           rowSelection=self.rowSelection,
+                           dataIndexes=dtree.as_rows(treeRandom.sample(
+                               self.dataRowIndexes, self.numRows),
+                               self.rowSelection),
                            attrIndexes=[
-                               i for i in random.sample(
+                               i for i in treeRandom.sample(
                                    self.attrIndexesExceptOutcomeIndex,
                                    self.numAttributes)])
 
-    def populate(self):
-        self._trees = [self._build_tree() for _ in range(0, self.numTrees)]
+    def _get_tree_seed(self):
+        return self._random.getrandbits(64)
+
+    def _build_trees(self, treeSeeds):
+        if self.numJobs is None or self.numJobs < 2:
+            return [self._build_tree(treeSeed) for treeSeed in treeSeeds]
+        dataset = self._dataset if isinstance(self._dataset, dtree.Dataset) \
+            else dtree.Dataset(self.data, self.continuousAttributes)
+        worker = copy.copy(self)
+        worker.data = None
+        worker._trees = None
+        worker._dataset = dataset.share()
+        try:
+            with ProcessPoolExecutor(self.numJobs,
+                                     initializer=_initialize_worker,
+                                     initargs=(worker,)) as pool:
+                return list(pool.map(
+                    _build_tree_in_worker, treeSeeds,
+                    chunksize=max(1, len(treeSeeds) // (4 * self.numJobs))))
+        finally:
+            worker._dataset.close()
 
-        if not self.boost:
-            return
+    def populate(self):
+        self._trees = self._build_trees(
+            [self._get_tree_seed() for _ in range(0, self.numTrees)])
+        if self.boost:
+            self._boost()
+        dtree.intern_values(self._trees)
+        if self.cache is not None:
+            self.enable_cache(self.cache.maxSize)
 
+    def _boost(self):
         outcomeLabelIndex = self.data[0].index(self.outcomeLabel)
+        dataRows = [self.data[dataRowIndex] for dataRowIndex in
+                    self.dataRowIndexes]
+        rowPredictions = [list(predictions) for predictions in zip(
+            *[t.predict_many(dataRows, self._random) for t in
+              self._trees])]
         anyChanged = True
         roundsRemaining = 10
         while anyChanged and roundsRemaining > 0:
             anyChanged = False
             roundsRemaining -= 1
-            for dataRowIndex in self.dataRowIndexes:
-                dataRow = self.data[dataRowIndex]
-                sorted_predictions, predictions = self._get_predictions(
-                    dataRow)
+            for dataRow, predictions in zip(dataRows, rowPredictions):
+                sorted_predictions = self._get_sorted_counts(predictions)
                 expectedPrediction = dataRow[outcomeLabelIndex]
                 if expectedPrediction == sorted_predictions[0][0]:
                     continue
@@ -90,27 +134,139 @@ class Forest:
                 for index, p in enumerate(predictions):
                     if p == expectedPrediction:
                         self.weights[index] = min(1, self.weights[
-                            index] + random.uniform(0, maxDifference))
+                            index] + self._random.uniform(0, maxDifference))
                         continue
                     if p == actualPrediction:
                         self.weights[index] = max(0, self.weights[
-                            index] - random.uniform(0, maxDifference))
+                            index] - self._random.uniform(0, maxDifference))
                         if self.weights[index] == 0:
-                            self._trees[index] = self._build_tree()
+                            self._trees[index] = self._build_tree(
+                                self._get_tree_seed())
                             self.weights[index] = 0.5
+                            for treePredictions, treePrediction in zip(
+                                    rowPredictions,
+                                    self._trees[index].predict_many(
+                                        dataRows, self._random)):
+                                treePredictions[index] = treePrediction
+
+    def save(self, path):
+        dtree.save_trees(path, self._trees, kind='forest',
+                         outcomeLabel=self.outcomeLabel, weights=self.weights)
+
+    def compile_trees(self):
+        for t in self._trees:
+            t.compile()
+
+    def enable_cache(self, maxSize=10000):
+        self.cache = dtree.PredictionCache(self._get_split_attr_indexes(),
+                                           maxSize)
 
-    def get_prediction(self, data):
+    def disable_cache(self):
+        self.cache = None
+
+    def get_prediction(self, data, earlyExit=False):
+        if earlyExit and self.cache is None:
+            return self._get_early_exit_prediction(data)
         sorted_predictions, _ = self._get_predictions(data)
         return sorted_predictions[0][0]
 
+    def _get_early_exit_prediction(self, data):
+        predictions = [None] * len(self._trees)
+        counts = {}
+        total = 0
+        for index, tree, weight, remainingWeight in self._get_vote_order():
+            p = predictions[index] = tree.get_prediction(data)
+            counts[p] = counts.get(p, 0) + weight
+            total += weight
+            if total <= remainingWeight:
+                continue
+            first = second = 0
+            for count in counts.values():
+                if count > first:
+                    first, second = count, first
+                elif count > second:
+                    second = count
+            if first - second > remainingWeight:
+                return max(counts, key=counts.get)
+        return self._get_sorted_counts(predictions)[0][0]
+
+    def _get_vote_order(self):
+        weights = tuple(self.weights)
+        if self._voteOrder is None or self._voteOrder[0] != weights or \
+                self._voteOrder[1] is not self._trees:
+            order = sorted(range(len(weights)), key=weights.__getitem__,
+                           reverse=True)
+            margin = 1e-9 * sum(weights)
+            votes = []
+            remaining = 0
+            for index in reversed(order):
+                votes.append((index, self._trees[index], weights[index],
+                              remaining + margin))
+                remaining += weights[index]
+            votes.reverse()
+            self._voteOrder = weights, self._trees, votes
+        return self._voteOrder[2]
+
+    def _get_split_attr_indexes(self):
+        return sorted(set().union(*(t.get_split_attr_indexes() for t in
+                                    self._trees)))
+
+    def predict_many(self, rows):
+        if isinstance(rows, dtree.Dataset):
+            rows = rows.get_rows(self._get_split_attr_indexes())
+        treePredictions = [t.predict_many(rows) for t in self._trees]
+        return [max(self._get_counts(predictions).items(),
+                    key=operator.itemgetter(1))[0]
+                for predictions in zip(*treePredictions)]
+
     def _get_predictions(self, data):
-        predictions = [t.get_prediction(data) for t in self._trees]
+        if self.cache is not None:
+            leafIndexes = self.cache.lookup(data, self._get_leaf_indexes)
+            predictions = [t.get_leaf_prediction(leafIndex) for t, leafIndex
+                           in zip(self._trees, leafIndexes)]
+        else:
+            predictions = [t.get_prediction(data) for t in self._trees]
+        return self._get_sorted_counts(predictions), predictions
+
+    def _get_leaf_indexes(self, data):
+        return [t.get_leaf_index(data) for t in self._trees]
+
+    def _get_sorted_counts(self, predictions):
+        return sorted(self._get_counts(predictions).items(),
+                      key=operator.itemgetter(1), reverse=True)
+
+    def _get_counts(self, predictions):
         counts = {p: 0 for p in set(predictions)}
-        for index, p in enumerate(predictions):
-            counts[p] += self.weights[index]
-        return sorted(counts.items(), key=operator.itemgetter(1),
-                      reverse=True), \
-               predictions
+        for p, weight in zip(predictions, self.weights):
+            counts[p] += weight
+        return counts
+
+
+def load(path, mapped=False):
+    metadata, trees = dtree.load_trees(path, mapped)
+    if metadata['kind'] != 'forest':
+        raise Exception('{} does not contain a forest'.format(path))
+    forest = Forest.__new__(Forest)
+    forest.data = None
+    forest.outcomeLabel = metadata['outcomeLabel']
+    forest.numTrees = len(trees)
+    forest.weights = metadata['weights']
+    forest._voteOrder = None
+    forest.cache = None
+    forest._trees = trees
+    return forest
+
+
+_workerForest = None
+
+
+def _initialize_worker(forest):
+    global _workerForest
+    _workerForest = forest
+
+
+def _build_tree_in_worker(treeSeed):
+    return _workerForest._build_tree(treeSeed)
 
 
 class Benchmark:
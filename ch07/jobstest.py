@@ -0,0 +1,45 @@
+# File: jobstest.py
+#    from chapter 7 of _Tree-based Machine Learning Algorithms_
+#
+# Author: Clinton Sheppard <fluentcoder@gmail.com>
+# Copyright (c) 2017 Clinton Sheppard
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.  See the License for the specific language governing
+# permissions and limitations under the License.
+
+import forest
+import random
+
+
+def build(data, continuousAttributes, boost, numJobs):
+    f = forest.Forest(data, 'Z', continuousAttributes, seed=7, boost=boost,
+                      numJobs=numJobs)
+    return [str(t) for t in f._trees], f.weights
+
+
+if __name__ == '__main__':
+    random.seed(1)
+    data = [['X', 'Y', 'Color', 'Z']]
+    for _ in range(1500):
+        data.append([float(random.randint(0, 30)),
+                     float(random.randint(0, 20)),
+                     random.choice(['red', 'green', 'blue']),
+                     float(random.randint(10, 40))])
+    for continuousAttributes, boost in ((['X', 'Y'], False),
+                                        (['X', 'Y', 'Z'], False),
+                                        (['X', 'Y'], True)):
+        name = "continuous {}{}".format(continuousAttributes,
+                                        ', boosted' if boost else '')
+        serial = build(data, continuousAttributes, boost, None)
+        if build(data, continuousAttributes, boost, 2) != serial:
+            raise Exception('{}: numJobs=2 forest differs from the serial '
+                            'forest'.format(name))
+        print("{}: numJobs=2 forest matches the serial forest".format(name))
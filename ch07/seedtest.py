@@ -0,0 +1,47 @@
+# File: seedtest.py
+#    from chapter 7 of _Tree-based Machine Learning Algorithms_
+#
+# Author: Clinton Sheppard <fluentcoder@gmail.com>
+# Copyright (c) 2017 Clinton Sheppard
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.  See the License for the specific language governing
+# permissions and limitations under the License.
+
+import forest
+import random
+
+
+random.seed(3)
+data = [['Color', 'Shape', 'Size', 'Outcome']]
+for _ in range(600):
+    color = random.choice(['red', 'green', 'blue'])
+    shape = random.choice(['round', 'square'])
+    size = random.choice(['small', 'large'])
+    outcome = random.choice(['yes', 'no']) if random.random() < .4 else \
+        'yes' if color == 'red' else 'no'
+    data.append([color, shape, size, outcome])
+
+
+def build(globalSeed):
+    random.seed(globalSeed)
+    f = forest.Forest(data, 'Outcome', [], seed=42, boost=True)
+    return [str(t) for t in f._trees], f.weights
+
+
+trees, weights = build(1)
+distributionLeaves = sum(t.count('[(') for t in trees)
+print("{} trees, {} distribution leaves".format(len(trees),
+                                                 distributionLeaves))
+if distributionLeaves == 0:
+    raise Exception('no distribution leaves to sample')
+if build(2) != (trees, weights):
+    raise Exception('boosted forest depends on the global random state')
+print("boosted forest built with seed=42 is reproducible")